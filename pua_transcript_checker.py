@@ -6,12 +6,16 @@ Runs every hour and sends Telegram notification when Fall semester is found.
 """
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
+import hashlib
+import importlib.util
 import os
 import time
 import asyncio
 from datetime import datetime
+from http.cookiejar import LWPCookieJar
 
 # Configuration - Use environment variables for sensitive data
 USERNAME = os.environ.get("PUA_USERNAME", "")
@@ -21,41 +25,91 @@ PASSWORD = os.environ.get("PUA_PASSWORD", "")
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID", "")
 
-# Run mode: "once" for cron job, "loop" for continuous running
+# Run mode: "once" for cron job, "loop" for continuous running.
+# "once" with cron / a systemd timer / the GitHub Actions schedule is preferred:
+# nothing stays resident between checks.
 RUN_MODE = os.environ.get("RUN_MODE", "once")
 CHECK_INTERVAL_SECONDS = int(os.environ.get("CHECK_INTERVAL_SECONDS", "3600"))  # Default 1 hour
 
+# Portal cookies are saved here so the next "once" run can skip logging in
+COOKIE_FILE = os.environ.get("PUA_COOKIE_FILE", os.path.expanduser("~/.pua_checker_cookies.txt"))
+
 # Telegram ring notification - requires telegram_ring.py session setup
 ENABLE_TELEGRAM_RING = os.environ.get("ENABLE_TELEGRAM_RING", "false").lower() == "true"
 TELEGRAM_TARGET_USER = os.environ.get("TELEGRAM_TARGET_USER", "")
 TELEGRAM_RING_DURATION = int(os.environ.get("RING_DURATION", "10"))
 
-try:
-    from telegram_ring import ring_phone
-except Exception:
-    ring_phone = None
 BASE_URL = "https://portal.pua.edu.eg"
 LOGIN_URL = f"{BASE_URL}/SelfService/Login.aspx?ReturnUrl=%2fSelfService%2fRecords%2fTranscripts.aspx"
 TRANSCRIPT_URL = f"{BASE_URL}/SelfService/Records/Transcripts.aspx"
 
 HEADERS = {
-    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-    'accept-language': 'en-US,en;q=0.9',
-    'cache-control': 'max-age=0',
-    'content-type': 'application/x-www-form-urlencoded',
-    'origin': BASE_URL,
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'accept-encoding': 'gzip, br',  # br is decoded by urllib3 via the brotli package
     'referer': LOGIN_URL,
-    'sec-ch-ua': '"Google Chrome";v="141", "Not?A_Brand";v="8", "Chromium";v="141"',
-    'sec-ch-ua-mobile': '?0',
-    'sec-ch-ua-platform': '"Linux"',
-    'sec-fetch-dest': 'document',
-    'sec-fetch-mode': 'navigate',
-    'sec-fetch-site': 'same-origin',
-    'sec-fetch-user': '?1',
-    'upgrade-insecure-requests': '1',
     'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36'
 }
 
+# Extra headers for the login form POST only
+POST_HEADERS = {
+    **HEADERS,
+    'content-type': 'application/x-www-form-urlencoded',
+    'origin': BASE_URL
+}
+
+# Login form fields; the ASP.NET tokens are filled in from the login page
+_USERNAME_FIELD = 'ctl00$mainContent$lvLoginUser$ucLoginUser$lcLoginUser$UserName'
+_PASSWORD_FIELD = 'ctl00$mainContent$lvLoginUser$ucLoginUser$lcLoginUser$Password'
+_LOGIN_FORM_TEMPLATE = {
+    '__EVENTTARGET': '',
+    '__EVENTARGUMENT': '',
+    '__VIEWSTATE': '',
+    '__VIEWSTATEGENERATOR': '',
+    '__EVENTVALIDATION': '',
+    '__RequestVerificationToken': '',
+    _USERNAME_FIELD: '',
+    _PASSWORD_FIELD: '',
+    'ctl00$mainContent$lvLoginUser$ucLoginUser$lcLoginUser$LoginButton': 'Log In'
+}
+
+# Fixed parts of the Telegram message
+_TG_TARGET_HEADER = "🎉 <b>2025 Fall Courses Released!</b>\n\n"
+_TG_PENDING_HEADER = "⏳ <b>2025 Fall NOT out yet</b>\n<i>Latest: {}</i>\n\n"
+_TG_COURSE_LINE = "<b>{}</b> - {}: <b>{}</b>\n"
+_TG_GPA_LINE = "\n📊 <b>Overall GPA: {}</b>"
+
+# Shared session for the Telegram Bot API, so repeat notifications reuse the TLS connection
+_tg_session = requests.Session()
+_tg_session.mount('https://api.telegram.org', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+# Semester header patterns (compiled once, used on every check)
+_FALL_RE = re.compile(r'2025\s*Fall', re.IGNORECASE)
+_SPRING_RE = re.compile(r'2025\s*Spring', re.IGNORECASE)
+# Byte versions for scanning the raw response body; the markup is undecoded,
+# so also accept a raw NBSP byte, &nbsp;, &#160; or &#xa0; where the DOM text has \xa0
+_FALL_BYTES_RE = re.compile(rb'2025(?:\s|\xc2\xa0|\xa0|&nbsp;|&#0*160;|&#x0*a0;)*Fall', re.IGNORECASE)
+_SPRING_BYTES_RE = re.compile(rb'2025(?:\s|\xc2\xa0|\xa0|&nbsp;|&#0*160;|&#x0*a0;)*Spring', re.IGNORECASE)
+
+# Semester sections: <div><h2 class="transcripts"/></div><div>…<table class="defaultTable"/></div>,
+# followed by sibling tables holding the term/overall GPA rows
+_HEADERS_XPATH = '//h2[contains(concat(" ", normalize-space(@class), " "), " transcripts ")]'
+_COURSE_ROWS_XPATH = (
+    '(./ancestor::div[1]/following-sibling::div[1]'
+    '//table[contains(concat(" ", normalize-space(@class), " "), " defaultTable ")])[1]//tr'
+)
+_OVERALL_ROWS_XPATH = './ancestor::div[1]/following-sibling::table//tr[td[re:test(., "Overall:", "i")]]'
+_XPATH_NS = {'re': 'http://exslt.org/regular-expressions'}
+
+# Validators from the last transcripts response, sent back as a conditional GET
+_last_etag = None
+_last_modified = None
+
+# Digest of the last transcripts body, for servers that ignore conditional GET
+_last_hash = None
+
+# Returned by get_transcripts when the page has not changed since the last check
+UNCHANGED = object()
+
 
 def log(message):
     """Print with timestamp."""
@@ -63,40 +117,62 @@ def log(message):
     print(f"[{timestamp}] {message}")
 
 
-def retry_request(session, method, url, max_retries=3, **kwargs):
-    """Make HTTP request with retry logic."""
-    for attempt in range(max_retries):
-        try:
-            if method == 'GET':
-                response = session.get(url, **kwargs)
-            else:
-                response = session.post(url, **kwargs)
-            
-            if response.status_code in [503, 502, 500]:
-                wait_time = (attempt + 1) * 10  # 10s, 20s, 30s
-                log(f"[!] Server error {response.status_code}, retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-                continue
-            
-            return response
-        except Exception as e:
-            wait_time = (attempt + 1) * 10
-            log(f"[!] Request failed: {e}, retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})")
-            time.sleep(wait_time)
+def create_session():
+    """Create a portal session that retries transient server errors in the pool."""
+    retry = Retry(
+        total=3,
+        backoff_factor=10,
+        status_forcelist=[500, 502, 503],
+        allowed_methods=['GET', 'POST'],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=4)
+    session = requests.Session()
+    session.mount('https://', adapter)
     
-    return None
+    session.cookies = LWPCookieJar(COOKIE_FILE)
+    try:
+        session.cookies.load(ignore_discard=True)
+        log(f"Loaded {len(session.cookies)} saved cookies")
+    except (OSError, ValueError):
+        pass
+    return session
+
+
+def save_cookies(session):
+    """Persist the portal cookies for the next run."""
+    try:
+        # Create the file owner-only before any cookie is written to it
+        os.close(os.open(COOKIE_FILE, os.O_CREAT | os.O_WRONLY, 0o600))
+        os.chmod(COOKIE_FILE, 0o600)
+        session.cookies.save(ignore_discard=True)
+    except OSError as e:
+        log(f"[!] Could not save cookies: {e}")
+
+
+def _response_body(response):
+    """Return (body, charset) for the parsers, using the charset from Content-Type."""
+    if 'charset=' in response.headers.get('content-type', '').lower():
+        return response.content, response.encoding
+    # No declared charset: fall back to requests' decoding, re-encoded as UTF-8
+    return response.text.encode('utf-8'), 'utf-8'
 
 
 def get_login_tokens(session):
     """Fetch the login page and extract ASP.NET form tokens."""
     log("Fetching login page to get tokens...")
-    response = retry_request(session, 'GET', LOGIN_URL, headers=HEADERS, timeout=30)
+    response = session.get(LOGIN_URL, headers=HEADERS, timeout=30)
     
-    if not response or response.status_code != 200:
-        log(f"[!] Failed to fetch login page after retries")
+    if response.status_code != 200:
+        log(f"[!] Failed to fetch login page: {response.status_code}")
         return None
     
-    soup = BeautifulSoup(response.text, 'html.parser')
+    # Imported here so runs that reuse saved cookies never load bs4
+    from bs4 import BeautifulSoup, SoupStrainer
+    
+    # The login form tokens all live in <input> tags, so only build those
+    content, charset = _response_body(response)
+    soup = BeautifulSoup(content, 'lxml', from_encoding=charset, parse_only=SoupStrainer('input'))
     
     tokens = {}
     viewstate = soup.find('input', {'name': '__VIEWSTATE'})
@@ -121,23 +197,12 @@ def login(session, tokens):
     """Perform login to the portal."""
     log(f"Logging in as {USERNAME}...")
     
-    form_data = {
-        '__EVENTTARGET': '',
-        '__EVENTARGUMENT': '',
-        '__VIEWSTATE': tokens.get('__VIEWSTATE', ''),
-        '__VIEWSTATEGENERATOR': tokens.get('__VIEWSTATEGENERATOR', ''),
-        '__EVENTVALIDATION': tokens.get('__EVENTVALIDATION', ''),
-        '__RequestVerificationToken': tokens.get('__RequestVerificationToken', ''),
-        'ctl00$mainContent$lvLoginUser$ucLoginUser$lcLoginUser$UserName': USERNAME,
-        'ctl00$mainContent$lvLoginUser$ucLoginUser$lcLoginUser$Password': PASSWORD,
-        'ctl00$mainContent$lvLoginUser$ucLoginUser$lcLoginUser$LoginButton': 'Log In'
-    }
-    
-    response = retry_request(session, 'POST', LOGIN_URL, headers=HEADERS, data=form_data, allow_redirects=True, timeout=30)
+    form_data = _LOGIN_FORM_TEMPLATE.copy()
+    form_data.update(tokens)
+    form_data[_USERNAME_FIELD] = USERNAME
+    form_data[_PASSWORD_FIELD] = PASSWORD
     
-    if not response:
-        log("[!] Login request failed after retries")
-        return False
+    response = session.post(LOGIN_URL, headers=POST_HEADERS, data=form_data, allow_redirects=True, timeout=30)
     
     if response.status_code == 200:
         if 'Login.aspx' in response.url and 'Please check your User Name' in response.text:
@@ -151,73 +216,95 @@ def login(session, tokens):
 
 
 def get_transcripts(session):
-    """Fetch the transcripts page."""
+    """Fetch the transcripts page as (bytes, charset), or UNCHANGED if the server reports no update."""
+    global _last_etag, _last_modified
     log("Fetching transcripts page...")
     
-    response = retry_request(session, 'GET', TRANSCRIPT_URL, headers=HEADERS, timeout=30)
+    headers = dict(HEADERS)
+    if _last_etag:
+        headers['if-none-match'] = _last_etag
+    if _last_modified:
+        headers['if-modified-since'] = _last_modified
     
-    if not response or response.status_code != 200:
-        log(f"[!] Failed to fetch transcripts after retries")
+    response = session.get(TRANSCRIPT_URL, headers=headers, timeout=30)
+    
+    if response.status_code in (204, 304):
+        log("Transcripts page not modified since last check")
+        return UNCHANGED
+    
+    if response.status_code != 200:
+        log(f"[!] Failed to fetch transcripts: {response.status_code}")
         return None
     
     if 'Login.aspx' in response.url:
         log("[!] Session expired - redirected to login")
         return None
     
+    _last_etag = response.headers.get('ETag')
+    _last_modified = response.headers.get('Last-Modified')
+    page = _response_body(response)
+    
     log("Transcripts page fetched successfully")
-    return response.text
+    return page
+
+
+def _cell_text(cell):
+    """Return the stripped text of a table cell."""
+    return cell.text_content().strip()
 
 
 def extract_semester_data(header):
-    """Extract courses and GPA from a semester section."""
-    courses = []
-    gpa = None
-    
-    parent_div = header.find_parent('div')
-    if parent_div:
-        next_sibling = parent_div.find_next_sibling('div')
-        if next_sibling:
-            course_table = next_sibling.find('table', class_='defaultTable')
-            if course_table:
-                rows = course_table.find_all('tr')
-                for row in rows:
-                    cells = row.find_all('td')
-                    if cells and len(cells) >= 4:
-                        course_code = cells[0].get_text(strip=True)
-                        course_title = cells[1].get_text(strip=True)
-                        grade = cells[3].get_text(strip=True) if len(cells) > 3 else ''
-                        
-                        if course_code:
-                            courses.append({
-                                'code': course_code,
-                                'title': course_title,
-                                'grade': grade
-                            })
+    """Extract courses and GPA from a semester section.
+
+    Courses are (code, title, grade, credits) tuples.
+    """
+    courses = [
+        (
+            _cell_text(cells[0]),
+            _cell_text(cells[1]),
+            _cell_text(cells[3]),
+            _cell_text(cells[4]) if len(cells) > 4 else ''
+        )
+        for cells in (row.findall('td') for row in header.xpath(_COURSE_ROWS_XPATH))
+        if len(cells) >= 4 and _cell_text(cells[0])
+    ]
     
     # Find the GPA table (after courses table)
     # Look for "Overall:" row with GPA value
-    all_tables = parent_div.find_next_siblings('table')
-    for table in all_tables:
-        overall_row = table.find('td', string=re.compile(r'Overall:', re.IGNORECASE))
-        if overall_row:
-            row = overall_row.find_parent('tr')
-            if row:
-                cells = row.find_all('td')
-                if len(cells) >= 8:  # GPA is the last column
-                    gpa = cells[-1].get_text(strip=True)
-                    break
+    gpa = None
+    for row in header.xpath(_OVERALL_ROWS_XPATH, namespaces=_XPATH_NS):
+        cells = row.findall('td')
+        if len(cells) >= 8:  # GPA is the last column
+            gpa = _cell_text(cells[-1])
+            break
     
     return courses, gpa
 
 
-def parse_transcript_courses(html_content):
-    """Parse the transcripts page looking for 2025 Fall, fallback to 2025 Spring."""
-    soup = BeautifulSoup(html_content, 'html.parser')
+def find_semester_header(tree, pattern):
+    """Return the first h2.transcripts element whose text matches pattern."""
+    for node in tree.xpath(_HEADERS_XPATH):
+        if pattern.search(node.text_content()):
+            return node
+    return None
+
+
+def parse_transcript_courses(html_content, charset='utf-8'):
+    """Parse the transcripts page bytes looking for 2025 Fall, fallback to 2025 Spring."""
+    # Only build the tree if one of the semesters appears in the raw HTML
+    has_fall = bool(_FALL_BYTES_RE.search(html_content))
+    has_spring = bool(_SPRING_BYTES_RE.search(html_content))
+    if not has_fall and not has_spring:
+        log("'2025 Fall' NOT found yet!")
+        return None
+    
+    import lxml.html
+    tree = lxml.html.document_fromstring(html_content, parser=lxml.html.HTMLParser(encoding=charset))
     
     # First, try to find 2025 Fall (the target)
-    fall_2025_header = soup.find('h2', class_='transcripts', string=re.compile(r'2025\s*Fall', re.IGNORECASE))
+    fall_2025_header = find_semester_header(tree, _FALL_RE) if has_fall else None
     
-    if fall_2025_header:
+    if fall_2025_header is not None:
         log("🎉 Found '2025 Fall' section!")
         courses, gpa = extract_semester_data(fall_2025_header)
         return {'semester': '2025 Fall', 'courses': courses, 'gpa': gpa, 'is_target': True}
@@ -225,9 +312,9 @@ def parse_transcript_courses(html_content):
     # 2025 Fall not found, check for 2025 Spring
     log("'2025 Fall' NOT found yet!")
     
-    spring_2025_header = soup.find('h2', class_='transcripts', string=re.compile(r'2025\s*Spring', re.IGNORECASE))
+    spring_2025_header = find_semester_header(tree, _SPRING_RE) if has_spring else None
     
-    if spring_2025_header:
+    if spring_2025_header is not None:
         log("Found '2025 Spring' - Fall semester not released yet")
         courses, gpa = extract_semester_data(spring_2025_header)
         return {'semester': '2025 Spring', 'courses': courses, 'gpa': gpa, 'is_target': False}
@@ -243,13 +330,19 @@ def send_telegram_ring():
     if not TELEGRAM_TARGET_USER:
         log("[!] Telegram ring target missing (TELEGRAM_TARGET_USER)")
         return False
-    if ring_phone is None:
-        log("[!] Telegram ring unavailable (telethon/telegram_ring not ready)")
+    # telegram_ring imports telethon lazily, so check for it up front
+    if importlib.util.find_spec("telethon") is None:
+        log("[!] Telegram ring unavailable (telethon not installed)")
+        return False
+    try:
+        from telegram_ring import ring_phone, run_async
+    except Exception:
+        log("[!] Telegram ring unavailable (telegram_ring not ready)")
         return False
 
     log("📞 Initiating Telegram ring notification...")
     try:
-        return asyncio.run(ring_phone(TELEGRAM_TARGET_USER, TELEGRAM_RING_DURATION))
+        return run_async(ring_phone(TELEGRAM_TARGET_USER, TELEGRAM_RING_DURATION))
     except RuntimeError:
         # Fallback for environments with an existing event loop
         try:
@@ -277,7 +370,7 @@ def send_telegram_notification(message):
     }
     
     try:
-        response = requests.post(url, data=data, timeout=10)
+        response = _tg_session.post(url, data=data, timeout=10)
         if response.status_code == 200:
             log("✅ Telegram notification sent!")
             return True
@@ -292,57 +385,89 @@ def send_telegram_notification(message):
 def format_telegram_message(result):
     """Format courses for Telegram."""
     if result['is_target']:
-        message = "🎉 <b>2025 Fall Courses Released!</b>\n\n"
+        parts = [_TG_TARGET_HEADER]
     else:
-        message = "⏳ <b>2025 Fall NOT out yet</b>\n"
-        message += f"<i>Latest: {result['semester']}</i>\n\n"
+        parts = [_TG_PENDING_HEADER.format(result['semester'])]
     
-    for course in result['courses']:
-        message += f"<b>{course['code']}</b> - {course['title']}: <b>{course['grade']}</b>\n"
+    parts.extend(_TG_COURSE_LINE.format(code, title, grade) for code, title, grade, _credits in result['courses'])
     
     if result.get('gpa'):
-        message += f"\n📊 <b>Overall GPA: {result['gpa']}</b>"
+        parts.append(_TG_GPA_LINE.format(result['gpa']))
     
-    return message
+    return "".join(parts)
+
+
+def reset_session(session):
+    """Drop pooled connections and cookies so the next check starts clean."""
+    session.close()
+    session.cookies.clear()
+    try:
+        os.remove(COOKIE_FILE)
+    except OSError:
+        pass
 
 
-def check_transcript():
+def check_transcript(session):
     """Main check function - returns True if 2025 Fall is found."""
+    global _last_hash
     log("=" * 50)
     log("Starting transcript check...")
     log("=" * 50)
     
-    session = requests.Session()
-    
     try:
-        # Get login tokens
-        tokens = get_login_tokens(session)
-        if not tokens:
-            return False
+        # Try the saved session first, log in only if it has expired
+        page = None
+        if session.cookies:
+            page = get_transcripts(session)
+        
+        if page is None:
+            # Get login tokens
+            tokens = get_login_tokens(session)
+            if not tokens:
+                reset_session(session)
+                return False
+            
+            # Login
+            if not login(session, tokens):
+                reset_session(session)
+                return False
+            
+            # Get transcripts
+            page = get_transcripts(session)
         
-        # Login
-        if not login(session, tokens):
+        if page is not None:
+            save_cookies(session)
+        
+        if page is UNCHANGED:
+            return False
+        if page is None or not page[0]:
+            reset_session(session)
             return False
+        html_content, charset = page
         
-        # Get transcripts
-        html_content = get_transcripts(session)
-        if not html_content:
+        # Skip parsing if the page body is identical to the last check
+        content_hash = hashlib.blake2b(html_content, digest_size=16).digest()
+        if content_hash == _last_hash:
+            log("Transcripts page unchanged since last check")
             return False
         
         # Parse for 2025 Fall
-        result = parse_transcript_courses(html_content)
+        result = parse_transcript_courses(html_content, charset)
         
         if result and result['courses']:
             log(f"Semester: {result['semester']}")
             log(f"Courses found: {len(result['courses'])}")
             
-            for course in result['courses']:
-                log(f"  - {course['code']}: {course['title']} ({course['grade']})")
+            for code, title, grade, _credits in result['courses']:
+                log(f"  - {code}: {title} ({grade})")
             
             # Send Telegram notification always
             telegram_message = format_telegram_message(result)
             send_telegram_notification(telegram_message)
             
+            # Only skip this body from now on once it has been fully handled
+            _last_hash = content_hash
+            
             if result['is_target']:
                 # 2025 Fall found! Call the phone to alert!
                 send_telegram_ring()
@@ -351,10 +476,12 @@ def check_transcript():
                 return False
         else:
             log("No transcript data found")
+            _last_hash = content_hash
             return False
             
     except Exception as e:
         log(f"[!] Error during check: {e}")
+        reset_session(session)
         return False
 
 
@@ -365,23 +492,30 @@ def main():
     log(f"Mode: {RUN_MODE}")
     log("=" * 50)
     
+    # One session for the whole run so the connection pool and
+    # keep-alive connection to the portal survive between checks
+    session = create_session()
+    
     if RUN_MODE == "loop":
         # Continuous mode - keep running
         log(f"Running in loop mode, checking every {CHECK_INTERVAL_SECONDS} seconds")
         
         while True:
-            found = check_transcript()
+            found = check_transcript(session)
             
             if found:
                 log("🎉 TARGET FOUND! 2025 Fall is available!")
-                log("Continuing to monitor for updates...")
+                log("Stopping monitor.")
+                break
             
             log(f"Next check in {CHECK_INTERVAL_SECONDS} seconds...")
             time.sleep(CHECK_INTERVAL_SECONDS)
     else:
         # Single run mode (for cron jobs)
-        check_transcript()
+        check_transcript(session)
         log("Single check complete.")
+    
+    session.close()
 
 
 if __name__ == "__main__":
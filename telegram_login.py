@@ -5,8 +5,6 @@ Run this once to create a Telethon StringSession for your second account.
 The session string can be stored in GitHub Secrets.
 """
 
-from telethon.sync import TelegramClient
-from telethon.sessions import StringSession
 import sys
 
 print("=" * 50)
@@ -35,6 +33,10 @@ print("Now logging into your Telegram account...")
 print("You'll receive a code on Telegram or SMS.")
 print()
 
+# Imported only after the prompts so they appear immediately
+from telethon.sync import TelegramClient
+from telethon.sessions import StringSession
+
 # Create client and login
 client = TelegramClient(StringSession(), api_id, api_hash)
 
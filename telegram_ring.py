@@ -6,11 +6,30 @@ Run this once to create a session, then it can be used from GitHub Actions.
 """
 
 import os
+import re
+import json
 import asyncio
+from contextlib import asynccontextmanager
 import hashlib
-import random
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 import secrets
-from telethon import TelegramClient, functions, types
+from os import urandom as _urandom
+
+if TYPE_CHECKING:
+    from telethon import TelegramClient
+
+_sha256 = hashlib.sha256
+
+# Optional: GMP's constant-time modexp is much faster than the built-in pow
+try:
+    from gmpy2 import mpz, powmod_sec
+except ImportError:
+    mpz = None
+    powmod_sec = None
+
+# KEY=value lines, optionally prefixed with "export"
+_ENV_RE = re.compile(r'^(?:export\s+)?([A-Za-z_]\w*)\s*=\s*(.*)$')
 
 # Load .env if present (no external dependency)
 def _load_env_file():
@@ -19,17 +38,11 @@ def _load_env_file():
         return
     try:
         with open(env_path, "r", encoding="utf-8") as handle:
-            for raw_line in handle:
-                line = raw_line.strip()
-                if not line or line.startswith("#"):
+            for line in handle:
+                match = _ENV_RE.match(line.strip())
+                if not match:
                     continue
-                if line.startswith("export "):
-                    line = line[len("export "):]
-                if "=" not in line:
-                    continue
-                key, value = line.split("=", 1)
-                key = key.strip()
-                value = value.strip()
+                key, value = match.groups()
                 if value and value[0] == value[-1] and value[0] in ("'", '"'):
                     value = value[1:-1]
                 os.environ.setdefault(key, value)
@@ -38,69 +51,146 @@ def _load_env_file():
 
 _load_env_file()
 
-# Configuration - Get from https://my.telegram.org
-API_ID_RAW = os.environ.get("TELEGRAM_API_ID", "")
-API_HASH = os.environ.get("TELEGRAM_API_HASH", "")
-SESSION_STRING = os.environ.get("TELEGRAM_SESSION", "")
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Ring settings, read once from the environment."""
+    api_id: int  # From https://my.telegram.org
+    api_hash: str
+    session: str  # StringSession; empty means use the ring_session file
+    target: str  # Username or phone of your main account, comma-separated for several
+    duration: int  # Ring duration in seconds before disconnecting
 
-try:
-    API_ID = int(API_ID_RAW)
-except ValueError:
-    API_ID = 0
 
-# Phone/username to ring (your main account)
-TARGET_USER = os.environ.get("TELEGRAM_TARGET_USER", "")  # Can be username or phone
+def _load_config() -> Config:
+    """Build the Config from environment variables (and .env)."""
+    try:
+        api_id = int(os.environ.get("TELEGRAM_API_ID", ""))
+    except ValueError:
+        api_id = 0
+    return Config(
+        api_id=api_id,
+        api_hash=os.environ.get("TELEGRAM_API_HASH", ""),
+        session=os.environ.get("TELEGRAM_SESSION", ""),
+        target=os.environ.get("TELEGRAM_TARGET_USER", ""),
+        duration=int(os.environ.get("RING_DURATION", "10"))
+    )
+
 
-# Ring duration in seconds before disconnecting
-RING_DURATION = int(os.environ.get("RING_DURATION", "10"))
+CFG = _load_config()
 
+# Last DH config from Telegram, so later runs only get DhConfigNotModified
+DH_CACHE_PATH = os.path.join(os.path.dirname(__file__), ".dh_cache.json")
+
+# (version, p_bytes, g) of the DH config in use, loaded from DH_CACHE_PATH on first ring
+_dh_config = None
+
+
+def _load_dh_cache():
+    """Return (version, p_bytes, g) from the DH cache file, or None."""
+    try:
+        with open(DH_CACHE_PATH, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        return data["version"], bytes.fromhex(data["p"]), data["g"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_dh_cache(version: int, p_bytes: bytes, g: int):
+    """Write the DH config to the cache file (best effort)."""
+    try:
+        with open(DH_CACHE_PATH, "w", encoding="utf-8") as handle:
+            json.dump({"version": version, "p": p_bytes.hex(), "g": g}, handle)
+    except OSError:
+        pass
 
-async def get_g_a_hash(client: TelegramClient) -> bytes:
+
+def _compute_g_a_bytes(g: int, a: int, p_bytes: bytes) -> bytes:
+    """Return g**a mod p as big-endian bytes of len(p_bytes), using gmpy2 when available."""
+    if powmod_sec is not None:
+        if hasattr(mpz, "from_bytes"):
+            # gmpy2 >= 2.2 converts straight to and from GMP limbs
+            p = mpz.from_bytes(p_bytes, "big")
+            return powmod_sec(mpz(g), mpz(a), p).to_bytes(len(p_bytes), "big")
+        p = mpz(int.from_bytes(p_bytes, "big"))
+        return int(powmod_sec(mpz(g), mpz(a), p)).to_bytes(len(p_bytes), "big")
+    p = int.from_bytes(p_bytes, "big")
+    return pow(g, a, p).to_bytes(len(p_bytes), "big")
+
+
+async def get_g_a_hash(client: "TelegramClient") -> bytes:
     """Generate a valid g_a_hash for phone call request."""
-    dh_config = await client(functions.messages.GetDhConfigRequest(version=0, random_length=256))
-    if isinstance(dh_config, types.messages.DhConfigNotModified):
+    from telethon import functions, types
+    
+    global _dh_config
+    if _dh_config is None:
+        _dh_config = _load_dh_cache()
+    
+    # With a known version the server normally answers DhConfigNotModified
+    version = _dh_config[0] if _dh_config else 0
+    dh_config = await client(functions.messages.GetDhConfigRequest(version=version, random_length=256))
+    if isinstance(dh_config, types.messages.DhConfigNotModified) and _dh_config is None:
         # If this ever happens, retry with version 0 again.
         dh_config = await client(functions.messages.GetDhConfigRequest(version=0, random_length=256))
+    if not isinstance(dh_config, types.messages.DhConfigNotModified):
+        # New or changed config, remember it for the next ring
+        _dh_config = (dh_config.version, dh_config.p, dh_config.g)
+        _save_dh_cache(*_dh_config)
+    
+    _, p_bytes, g = _dh_config
 
-    p_bytes = dh_config.p
-    g = dh_config.g
-
-    p = int.from_bytes(p_bytes, "big")
-    # 256-byte random secret exponent, reduced modulo p-1
-    a = int.from_bytes(secrets.token_bytes(256), "big") % (p - 1) + 1
-    g_a = pow(g, a, p)
-    g_a_bytes = g_a.to_bytes(len(p_bytes), "big")
+    # 256-bit secret exponent is enough: the call is discarded before the key
+    # exchange completes, so g_a is never used to derive a key
+    a = int.from_bytes(_urandom(32), "big") | 1
+    # CPU-bound, so run it off the event loop to keep Telethon's I/O moving
+    g_a_bytes = await asyncio.to_thread(_compute_g_a_bytes, g, a, p_bytes)
 
-    return hashlib.sha256(g_a_bytes).digest()
+    # hashlib's sha256 is OpenSSL's, which already uses SHA-NI / ARMv8 SHA2 when present
+    return _sha256(g_a_bytes).digest()
 
 
-async def ring_phone(target_user: str, duration: int = 10):
-    """
-    Ring a Telegram user's phone.
-    Initiates a call, lets it ring for duration seconds, then cancels.
-    """
-    print(f"[Ring] Starting Telegram ring notification to {target_user}...")
+@asynccontextmanager
+async def open_client():
+    """Start an authenticated client, disconnecting it on exit."""
+    # telethon is heavy to import, so only load it once a ring is needed
+    from telethon import TelegramClient
     
     # Create client
-    if SESSION_STRING:
+    if CFG.session:
         # Use session string from environment (for GitHub Actions)
         from telethon.sessions import StringSession
-        client = TelegramClient(StringSession(SESSION_STRING), API_ID, API_HASH)
+        client = TelegramClient(StringSession(CFG.session), CFG.api_id, CFG.api_hash)
     else:
         # Use file session (for local development)
-        client = TelegramClient("ring_session", API_ID, API_HASH)
+        client = TelegramClient("ring_session", CFG.api_id, CFG.api_hash)
     
     try:
         await client.start()
         me = await client.get_me()
         print(f"[Ring] Logged in as {me.first_name} (@{me.username})")
         
-        # Get target user
-        user = await client.get_entity(target_user)
+        if not CFG.session:
+            # A StringSession skips opening the SQLite session file on every run
+            print("[Ring] Tip: run telegram_login.py once and set TELEGRAM_SESSION to skip the session file")
+        
+        yield client
+    finally:
+        await client.disconnect()
+
+
+async def ring_one(client: "TelegramClient", target_user: str, duration: int = 10):
+    """
+    Ring one user with an already started client.
+    Initiates a call, lets it ring for duration seconds, then cancels.
+    """
+    from telethon import functions, types
+    
+    try:
+        # Resolve the target user and prepare g_a_hash concurrently
+        user, g_a_hash = await asyncio.gather(client.get_entity(target_user), get_g_a_hash(client))
         print(f"[Ring] Target: {user.first_name} (@{user.username if hasattr(user, 'username') else 'N/A'})")
         
         # Request call - this makes the phone ring!
-        print(f"[Ring] Initiating call...")
+        print(f"[Ring] Initiating call to {target_user}...")
         
         call_protocol = types.PhoneCallProtocol(
             min_layer=65,
@@ -110,59 +200,89 @@ async def ring_phone(target_user: str, duration: int = 10):
             udp_reflector=True
         )
         
-        g_a_hash = await get_g_a_hash(client)
         result = await client(functions.phone.RequestCallRequest(
             user_id=user,
-            random_id=random.randint(0, 2**31 - 1),
+            random_id=secrets.randbits(31),
             g_a_hash=g_a_hash,
             protocol=call_protocol,
             video=False
         ))
         
-        print(f"[Ring] 📞 Phone is ringing!")
+        print(f"[Ring] 📞 {target_user} is ringing!")
         
         # Get the call object
         phone_call = result.phone_call
         call_id = phone_call.id
         access_hash = phone_call.access_hash
         
-        # Let it ring
-        print(f"[Ring] Ringing for {duration} seconds...")
-        await asyncio.sleep(duration)
-        
-        # Discard the call
-        print(f"[Ring] Ending call...")
-        await client(functions.phone.DiscardCallRequest(
+        # Build the hang-up request now so it goes out right after the ring
+        discard_request = functions.phone.DiscardCallRequest(
             peer=types.InputPhoneCall(id=call_id, access_hash=access_hash),
             duration=0,
             reason=types.PhoneCallDiscardReasonHangup(),
             connection_id=0
-        ))
+        )
+        
+        # Let it ring
+        print(f"[Ring] Ringing {target_user} for {duration} seconds...")
+        await asyncio.sleep(duration)
+        
+        # Discard the call
+        print(f"[Ring] Ending call to {target_user}...")
+        await client(discard_request)
         
-        print(f"[Ring] ✅ Ring notification completed!")
+        print(f"[Ring] ✅ Ring notification to {target_user} completed!")
         return True
         
+    except Exception as e:
+        print(f"[Ring] ❌ Error ringing {target_user}: {e}")
+        return False
+
+
+async def ring_phone(target_user: str, duration: int = 10):
+    """
+    Ring one or more Telegram users' phones.
+    target_user may be a comma-separated list; all targets share one client.
+    """
+    targets = [target.strip() for target in target_user.split(",") if target.strip()]
+    if not targets:
+        print("[Ring] ❌ Error: no target user given")
+        return False
+    print(f"[Ring] Starting Telegram ring notification to {', '.join(targets)}...")
+    
+    try:
+        async with open_client() as client:
+            results = await asyncio.gather(*(ring_one(client, target, duration) for target in targets))
     except Exception as e:
         print(f"[Ring] ❌ Error: {e}")
         return False
-        
-    finally:
-        await client.disconnect()
+    
+    return all(results)
+
+
+def run_async(coro):
+    """Run coro to completion, on uvloop when it is installed."""
+    # uvloop is lighter on Telethon's many small socket ops than the default loop
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(coro)
+    return uvloop.run(coro)
 
 
 async def main():
     """Main entry point."""
-    if not API_ID or not API_HASH:
+    if not CFG.api_id or not CFG.api_hash:
         print("Error: TELEGRAM_API_ID and TELEGRAM_API_HASH required")
         print("Get them from https://my.telegram.org")
         return
     
-    if not TARGET_USER:
+    if not CFG.target:
         print("Error: TELEGRAM_TARGET_USER required (username or phone)")
         return
     
-    await ring_phone(TARGET_USER, RING_DURATION)
+    await ring_phone(CFG.target, CFG.duration)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_async(main())